@@ -75,6 +75,14 @@ extra_deps['dev'] = [
     'uvicorn==0.20.0',
 ]
 
+extra_deps['deflate'] = [
+    'deflate>=0.4.0,<1',
+]
+
+extra_deps['msgpack'] = [
+    'msgspec>=0.18.0,<1',
+]
+
 extra_deps['docs'] = [
     'GitPython==3.1.30',
     'docutils==0.17.1',
@@ -13,6 +13,11 @@ import snappy
 import zstd
 from typing_extensions import Self
 
+try:
+    import deflate
+except ImportError:
+    deflate = None
+
 __all__ = [
     'compress', 'decompress', 'get_compression_extension', 'get_compressions', 'is_compression'
 ]
@@ -121,6 +126,10 @@ class Gzip(LevelledCompression):
         self.level = level
 
     def compress(self, data: bytes) -> bytes:
+        # Shards are compressed in one shot, so prefer libdeflate (much faster than zlib on whole
+        # buffers) when it is installed. Its output is a standard single-member gzip stream.
+        if deflate is not None:
+            return deflate.gzip_compress(data, self.level)
         return gzip.compress(data, self.level)
 
     def decompress(self, data: bytes) -> bytes:
@@ -7,7 +7,7 @@ import json
 import os
 from enum import IntEnum
 from multiprocessing.shared_memory import SharedMemory
-from threading import Thread
+from threading import Condition, Thread
 from time import sleep, time
 from typing import Any, Dict, Iterator, Optional, Tuple
 
@@ -57,6 +57,9 @@ class _PartitionState:
     * The download cursor points to the sample we are downloading (skipping other workers'
       downloads in progress).
 
+    Threads that are waiting for the yield cursor to advance (or for the state to be stopped) are
+    woken through ``cv`` instead of polling.
+
     Args:
         sample_ids (NDArray[np.int64]): This worker's partition of the sample space.
     """
@@ -68,10 +71,23 @@ class _PartitionState:
         self.ready_index = 0
         self.download_index = 0
         self.is_stopped = False
+        self.cv = Condition()
 
     def stop(self) -> None:
         """Stop the thread and exit."""
-        self.is_stopped = True
+        with self.cv:
+            self.is_stopped = True
+            self.cv.notify_all()
+
+    def wait_for_yield(self, yield_index: int, timeout: float) -> None:
+        """Block until the yield cursor moves past the given index, we are stopped, or timeout.
+
+        Args:
+            yield_index (int): The yield cursor position the caller last saw.
+            timeout (float): Maximum time to wait, in seconds.
+        """
+        with self.cv:
+            self.cv.wait_for(lambda: self.is_stopped or yield_index < self.yield_index, timeout)
 
     def __iter__(self) -> Iterator[int]:
         """Iterate over our samples while waiting for them to download first.
@@ -84,7 +100,9 @@ class _PartitionState:
                 sample_id = self.sample_ids[self.yield_index]
                 if sample_id != -1:  # If -1, we skip.
                     yield sample_id
-                self.yield_index += 1
+                with self.cv:
+                    self.yield_index += 1
+                    self.cv.notify_all()
                 continue
             if self.is_stopped:
                 break
@@ -652,6 +670,10 @@ class StreamingDataset(IterableDataset):
         """
         shard_states_lock, shard_states = self._get_shard_states()
 
+        # Span of sample IDs of the shard of the last sample, which is used to skip lookups.
+        shard_id = -1
+        shard_begin = shard_end = 0
+
         # Download loop.
         while True:
             # If we've started a new epoch early (__iter__ was called again), exit this thread
@@ -668,7 +690,7 @@ class StreamingDataset(IterableDataset):
             if self.predownload is not None:
                 samples_ahead = state.download_index - state.yield_index
                 if self.predownload <= samples_ahead:
-                    sleep(TICK)
+                    state.wait_for_yield(state.yield_index, TICK)
                     continue
 
             # If we hit -1, we skip.
@@ -677,8 +699,11 @@ class StreamingDataset(IterableDataset):
                 state.download_index += 1
                 continue
 
-            # Download and decompress the shard for this sample, if not already done.
-            shard_id, _ = self.index.find_sample(sample_id)
+            # Download and decompress the shard for this sample, if not already done. Consecutive
+            # samples tend to share a shard, so only look up the shard when we leave the last one.
+            if not shard_begin <= sample_id < shard_end:
+                shard_id, _ = self.index.find_sample(sample_id)
+                shard_begin, shard_end = self.index.get_shard_span(shard_id)
             self._download_or_skip_shard(shard_states_lock, shard_states, shard_id, False)
             state.download_index += 1
 
@@ -696,6 +721,10 @@ class StreamingDataset(IterableDataset):
         """
         _, shard_states = self._get_shard_states()
 
+        # Span of sample IDs of the shard of the last sample, which is used to skip lookups.
+        shard_id = -1
+        shard_begin = shard_end = 0
+
         # Download loop.
         while True:
             # If we've started a new epoch early (__iter__ was called again), exit this thread
@@ -712,7 +741,7 @@ class StreamingDataset(IterableDataset):
             if self.predownload is not None:
                 samples_ahead = state.ready_index - state.yield_index
                 if self.predownload <= samples_ahead:
-                    sleep(TICK)
+                    state.wait_for_yield(state.yield_index, TICK)
                     continue
 
             # If we hit -1, we skip.
@@ -721,8 +750,11 @@ class StreamingDataset(IterableDataset):
                 state.ready_index += 1
                 continue
 
-            # Download and decompress the shard for this sample, if not already done.
-            shard_id, _ = self.index.find_sample(sample_id)
+            # Download and decompress the shard for this sample, if not already done. Consecutive
+            # samples tend to share a shard, so only look up the shard when we leave the last one.
+            if not shard_begin <= sample_id < shard_end:
+                shard_id, _ = self.index.find_sample(sample_id)
+                shard_begin, shard_end = self.index.get_shard_span(shard_id)
             while shard_states[shard_id] != _ShardState.DOWNLOADED:
                 sleep(TICK)
             state.ready_index += 1
@@ -6,18 +6,23 @@
 import json
 import os
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 from tempfile import mkdtemp
 from types import TracebackType
-from typing import Any, Dict, List, Optional, Tuple, Type
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
 
 from typing_extensions import Self
 
 from streaming.base.compression import compress, get_compression_extension, is_compression
-from streaming.base.hashing import get_hash, is_hash
+from streaming.base.hashing import get_hash, get_hasher, is_hash
 from streaming.base.index import get_index_basename
 
 __all__ = ['JointWriter', 'SplitWriter']
 
+# Below this many bytes, hashing with several algorithms is not worth spreading over threads.
+_PARALLEL_HASH_MIN_SIZE = 1 << 20
+
 
 def upload(local: str, remote: str) -> None:
     """Placeholder upload method.
@@ -33,6 +38,179 @@ def upload(local: str, remote: str) -> None:
     shutil.copy(local, remote)
 
 
+def get_file_info(data: bytes, basename: str, hashes: List[str]) -> Dict[str, Any]:
+    """Generate file metadata.
+
+    Args:
+        data (bytes): The file data.
+        basename (str): The file's basename.
+        hashes (List[str]): Hash algorithms to apply to the file data.
+
+    Returns:
+        Dict[str, Any]: File metadata.
+    """
+    if 1 < len(hashes) and _PARALLEL_HASH_MIN_SIZE <= len(data):
+        # The hash functions release the GIL on large buffers, so run the algorithms at once.
+        with ThreadPoolExecutor(len(hashes)) as pool:
+            digests = dict(zip(hashes, pool.map(get_hash, hashes, repeat(data))))
+    else:
+        digests = {}
+        for algo in hashes:
+            digests[algo] = get_hash(algo, data)
+    return {'basename': basename, 'bytes': len(data), 'hashes': digests}
+
+
+class ChunkHasher:
+    """Hashes data that arrives in chunks with each of the given algorithms.
+
+    Used as a context manager, which shuts down the threads it may hash with on exit.
+
+    Args:
+        size (int): Total size of the data, which decides whether to hash in parallel.
+        hashes (List[str]): Hash algorithms to apply to the data.
+    """
+
+    def __init__(self, size: int, hashes: List[str]) -> None:
+        self.hashes = hashes
+        self._hashers = [get_hasher(algo) for algo in hashes]
+        if 1 < len(hashes) and _PARALLEL_HASH_MIN_SIZE <= size:
+            # The hash functions release the GIL on large buffers, so run the algorithms at once.
+            self._pool = ThreadPoolExecutor(len(hashes))
+        else:
+            self._pool = None
+
+    def __enter__(self) -> Self:
+        """Enter context manager.
+
+        Returns:
+            Self: This object.
+        """
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]], exc: Optional[BaseException],
+                 traceback: Optional[TracebackType]) -> None:
+        """Exit context manager.
+
+        Args:
+            exc_type (Type[BaseException], optional): Exc type.
+            exc (BaseException, optional): Exc.
+            traceback (TracebackType, optional): Traceback.
+        """
+        if self._pool:
+            self._pool.shutdown()
+
+    def update(self, chunk: bytes) -> None:
+        """Hash the next chunk of the data.
+
+        Args:
+            chunk (bytes): Chunk of data.
+        """
+        if self._pool:
+            futures = [self._pool.submit(hasher.update, chunk) for hasher in self._hashers]
+            for future in futures:
+                future.result()
+        else:
+            for hasher in self._hashers:
+                hasher.update(chunk)
+
+    def hexdigests(self) -> Dict[str, str]:
+        """Get the digests of the data so far.
+
+        Returns:
+            Dict[str, str]: Mapping of hash algorithm to hex digest.
+        """
+        digests = {}
+        for algo, hasher in zip(self.hashes, self._hashers):
+            digests[algo] = hasher.hexdigest()
+        return digests
+
+
+def hash_chunks(chunks: Iterable[bytes], size: int, hashes: List[str]) -> Dict[str, str]:
+    """Hash data that arrives in chunks with each of the given algorithms, consuming the chunks.
+
+    Args:
+        chunks (Iterable[bytes]): The data, in order.
+        size (int): Total size of the data, which decides whether to hash in parallel.
+        hashes (List[str]): Hash algorithms to apply to the data.
+
+    Returns:
+        Dict[str, str]: Mapping of hash algorithm to hex digest.
+    """
+    with ChunkHasher(size, hashes) as hasher:
+        for chunk in chunks:
+            hasher.update(chunk)
+        return hasher.hexdigests()
+
+
+def process_file(raw_data: bytes, raw_basename: str, zip_basename: Optional[str], local: str,
+                 compression: Optional[str], hashes: List[str]) -> Tuple[dict, Optional[dict]]:
+    """Process and save a shard file (hash, compress, hash, write).
+
+    This is a free function so that it can be run in a worker process.
+
+    Args:
+        raw_data (bytes): Uncompressed data.
+        raw_basename (str): Uncompressed basename.
+        zip_basename (str, optional): Compressed basename.
+        local (str): Local output dataset directory.
+        compression (str, optional): Optional compression or compression:level.
+        hashes (List[str]): Hash algorithms to apply to shard files.
+
+    Returns:
+        Tuple[dict, Optional[dict]]: Raw and compressed file metadata.
+    """
+    raw_info = get_file_info(raw_data, raw_basename, hashes)
+    if zip_basename:
+        zip_data = compress(compression, raw_data)
+        zip_info = get_file_info(zip_data, zip_basename, hashes)
+        data = zip_data
+        basename = zip_basename
+    else:
+        zip_info = None
+        data = raw_data
+        basename = raw_basename
+    filename = os.path.join(local, basename)
+    with open(filename, 'wb') as out:
+        out.write(data)
+    return raw_info, zip_info
+
+
+def process_shard_file(raw_info: Dict[str, Any], zip_basename: Optional[str], local: str,
+                       compression: Optional[str],
+                       hashes: List[str]) -> Tuple[dict, Optional[dict]]:
+    """Process a shard file that was already saved and hashed uncompressed (compress, hash, write).
+
+    Compression needs the whole file, so in that case the file is read back and replaced by its
+    compressed version.
+
+    This is a free function so that it can be run in a worker process, to which the saved file is
+    handed off.
+
+    Args:
+        raw_info (Dict[str, Any]): Uncompressed file metadata, whose file must exist in ``local``.
+        zip_basename (str, optional): Compressed basename.
+        local (str): Local output dataset directory.
+        compression (str, optional): Optional compression or compression:level.
+        hashes (List[str]): Hash algorithms to apply to shard files.
+
+    Returns:
+        Tuple[dict, Optional[dict]]: Raw and compressed file metadata.
+    """
+    if not zip_basename:
+        return raw_info, None
+
+    raw_filename = os.path.join(local, raw_info['basename'])
+    with open(raw_filename, 'rb') as fp:
+        raw_data = fp.read()
+    os.remove(raw_filename)
+    zip_data = compress(compression, raw_data)
+    zip_info = get_file_info(zip_data, zip_basename, hashes)
+    filename = os.path.join(local, zip_basename)
+    with open(filename, 'wb') as out:
+        out.write(zip_data)
+    return raw_info, zip_info
+
+
 class Writer(ABC):
     """Writes a streaming dataset.
 
@@ -58,6 +236,7 @@ class Writer(ABC):
     """
 
     format: str = ''  # Name of the format (like "mds", "csv", "json", etc).
+    lazy_local: bool = False  # Whether to set up the local directory on first use, not on init.
 
     def __init__(self,
                  *,
@@ -107,13 +286,23 @@ class Writer(ABC):
 
         self.shards = []
 
-        # Raise an exception if the directory is not empty
-        if os.path.exists(local) and len(os.listdir(local)) != 0:
-            raise FileExistsError(f'Directory is not empty: {local}')
-        os.makedirs(local, exist_ok=True)
+        self._local_ready = False
+        if not self.lazy_local:
+            self._prepare_local()
 
         self._reset_cache()
 
+    def _prepare_local(self) -> None:
+        """Check and create the local output directory, if not done already."""
+        if self._local_ready:
+            return
+
+        # Raise an exception if the directory is not empty
+        if os.path.exists(self.local) and len(os.listdir(self.local)) != 0:
+            raise FileExistsError(f'Directory is not empty: {self.local}')
+        os.makedirs(self.local, exist_ok=True)
+        self._local_ready = True
+
     def _reset_cache(self) -> None:
         """Reset our internal shard-building cache.
 
@@ -166,10 +355,7 @@ class Writer(ABC):
         Returns:
             Dict[str, Any]: File metadata.
         """
-        hashes = {}
-        for algo in self.hashes:
-            hashes[algo] = get_hash(algo, data)
-        return {'basename': basename, 'bytes': len(data), 'hashes': hashes}
+        return get_file_info(data, basename, self.hashes)
 
     def _process_file(self, raw_data: bytes, raw_basename: str,
                       zip_basename: Optional[str]) -> Tuple[dict, Optional[dict]]:
@@ -183,20 +369,8 @@ class Writer(ABC):
         Returns:
             Dict[str, Any]: Metadata containing basename, size, and hashes.
         """
-        raw_info = self._hash(raw_data, raw_basename)
-        if zip_basename:
-            zip_data = compress(self.compression, raw_data)
-            zip_info = self._hash(zip_data, zip_basename)
-            data = zip_data
-            basename = zip_basename
-        else:
-            zip_info = None
-            data = raw_data
-            basename = raw_basename
-        filename = os.path.join(self.local, basename)
-        with open(filename, 'wb') as out:
-            out.write(data)
-        return raw_info, zip_info
+        return process_file(raw_data, raw_basename, zip_basename, self.local, self.compression,
+                            self.hashes)
 
     def get_config(self) -> Dict[str, Any]:
         """Get object describing shard-writing configuration.
@@ -7,14 +7,15 @@ import json
 import pickle
 from abc import ABC, abstractmethod
 from io import BytesIO
-from typing import Any, Optional, Set
+from typing import Any, Callable, Optional, Set
 
 import numpy as np
 from PIL import Image
 from PIL.JpegImagePlugin import JpegImageFile
 
 __all__ = [
-    'get_mds_encoded_size', 'get_mds_encodings', 'is_mds_encoding', 'mds_decode', 'mds_encode'
+    'get_mds_encoded_size', 'get_mds_encoder', 'get_mds_encodings', 'get_mds_scalar_dtype',
+    'get_mds_struct_format', 'is_mds_encoding', 'mds_decode', 'mds_encode'
 ]
 
 
@@ -289,6 +290,42 @@ _encodings = {
     'json': JSON,
 }
 
+# Struct format characters of the encodings that store a single fixed-size number.
+_struct_formats = {
+    'uint8': 'B',
+    'uint16': 'H',
+    'uint32': 'I',
+    'uint64': 'Q',
+    'int8': 'b',
+    'int16': 'h',
+    'int32': 'i',
+    'int64': 'q',
+    'float16': 'e',
+    'float32': 'f',
+    'float64': 'd',
+}
+
+
+def _encode_bytes(obj: bytes) -> bytes:
+    """Fast path of ``Bytes.encode``, which falls back to it for anything but exact bytes."""
+    if type(obj) is bytes:
+        return obj
+    return Bytes().encode(obj)
+
+
+def _encode_str(obj: str) -> bytes:
+    """Fast path of ``Str.encode``, which falls back to it for anything but exact str."""
+    if type(obj) is str:
+        return obj.encode('utf-8')
+    return Str().encode(obj)
+
+
+# Plain functions for the most common variable-size encodings, skipping method dispatch.
+_fast_encoders = {
+    'bytes': _encode_bytes,
+    'str': _encode_str,
+}
+
 
 def get_mds_encodings() -> Set[str]:
     """List supported encodings.
@@ -327,6 +364,23 @@ def mds_encode(encoding: str, obj: Any) -> bytes:
     return cls().encode(obj)
 
 
+def get_mds_encoder(encoding: str) -> Callable[[Any], bytes]:
+    """Get the encode function for the given encoding, for reuse across many objects.
+
+    Unlike ``mds_encode``, the returned function does not pass through already-encoded bytes.
+
+    Args:
+        encoding (str): Encoding.
+
+    Returns:
+        Callable[[Any], bytes]: Function that encodes an object to bytes.
+    """
+    if encoding in _fast_encoders:
+        return _fast_encoders[encoding]
+    cls = _encodings[encoding]
+    return cls().encode
+
+
 def mds_decode(encoding: str, data: bytes) -> Any:
     """Decode the given data from bytes to the original object.
 
@@ -352,3 +406,30 @@ def get_mds_encoded_size(encoding: str) -> Optional[int]:
     """
     cls = _encodings[encoding]
     return cls().size
+
+
+def get_mds_struct_format(encoding: str) -> Optional[str]:
+    """Get the struct format character that this encoding is equivalent to, or None if N/A.
+
+    Args:
+        encoding (str): Encoding.
+
+    Returns:
+        Optional[str]: Struct format character.
+    """
+    return _struct_formats.get(encoding)
+
+
+def get_mds_scalar_dtype(encoding: str) -> Optional[type]:
+    """Get the numpy type of the single fixed-size number this encoding stores, or None if N/A.
+
+    Args:
+        encoding (str): Encoding.
+
+    Returns:
+        Optional[type]: Numpy scalar type.
+    """
+    cls = _encodings[encoding]
+    if not issubclass(cls, Scalar):
+        return None
+    return cls().dtype
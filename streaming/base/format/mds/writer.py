@@ -4,20 +4,90 @@
 """:class:`MDSWriter` writes samples to ``.mds`` files that can be read by :class:`MDSReader`."""
 
 import json
-from typing import Any, Dict, List, Optional
+import os
+import struct
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import IO, Any, Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 
-from streaming.base.format.base.writer import JointWriter
-from streaming.base.format.mds.encodings import (get_mds_encoded_size, get_mds_encodings,
-                                                 is_mds_encoding, mds_encode)
+from streaming.base.format.base.writer import ChunkHasher, JointWriter, process_shard_file
+from streaming.base.format.mds.encodings import (get_mds_encoded_size, get_mds_encoder,
+                                                 get_mds_encodings, get_mds_scalar_dtype,
+                                                 get_mds_struct_format, is_mds_encoding)
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
 
 __all__ = ['MDSWriter']
 
+# Size of each read when copying samples out of a shard's temporary file.
+_COPY_SIZE = 1 << 22
+
+
+def _validate_type(obj: Any, expected_type: type) -> None:
+    """Check that a value is of the type its column's encoding takes, like the MDS encodings do.
+
+    Args:
+        obj (Any): Column value.
+        expected_type (type): Type the column's encoding takes.
+    """
+    if not isinstance(obj, expected_type):
+        raise AttributeError(
+            f'data should be of type {expected_type}, but instead, found as {type(obj)}')
+
+
+def _get_msgpack_prepare(encoding: str, encoder: Callable[[Any], bytes]) -> Callable[[Any], Any]:
+    """Get the function that converts a column's values to what a msgpack row stores for them.
+
+    Values are held to the column's declared encoding, so that the shard config can be trusted: str
+    and bytes values are type-checked, numbers are cast through the column's dtype (which raises on
+    out of range integers), and everything else is encoded to bytes by its MDS encoding, passing
+    already-encoded bytes through.
+
+    Args:
+        encoding (str): Column encoding.
+        encoder (Callable[[Any], bytes]): Column's MDS encode function.
+
+    Returns:
+        Callable[[Any], Any]: Function that converts a value to a msgpack-native object.
+    """
+    dtype = get_mds_scalar_dtype(encoding)
+    if encoding in {'bytes', 'str'}:
+        expected_type = bytes if encoding == 'bytes' else str
+
+        def prepare(obj: Any) -> Any:
+            _validate_type(obj, expected_type)
+            return obj
+    elif encoding == 'int':
+
+        def prepare(obj: Any) -> Any:
+            _validate_type(obj, int)
+            return np.int64(obj).item()
+    elif dtype is not None:
+
+        def prepare(obj: Any) -> Any:
+            return dtype(obj).item()
+    else:
+
+        def prepare(obj: Any) -> Any:
+            return obj if isinstance(obj, bytes) else encoder(obj)
+
+    return prepare
+
 
 class MDSWriter(JointWriter):
     """Writes a streaming MDS dataset.
 
+    Encoded samples are streamed to a temporary file next to the shard being built, instead of
+    being held in memory, and the shard header is written in front of them when it is flushed.
+
+    The local directory is only checked and created on the first write (or on finish), so that
+    writers which never see a sample cost no filesystem work.
+
     Args:
         columns (Dict[str, str]): Sample columns.
         local: (str, optional): Optional local output dataset directory. If not provided, a random
@@ -34,10 +104,21 @@ class MDSWriter(JointWriter):
             Defaults to ``None``.
         size_limit (int, optional): Optional shard size limit, after which point to start a new
             shard. If ``None``, puts everything in one shard. Defaults to ``1 << 26``.
+        compression_workers (int): Number of worker processes with which to compress, hash, and
+            save finished shards in the background while the next shard is being encoded. Only
+            used with ``compression``. If ``0``, shards are compressed inline. Defaults to ``0``.
+        row_format (str): How to lay out the columns of each sample. ``per_column`` encodes each
+            column with its MDS encoding behind a header of sizes. ``msgpack`` checks or casts each
+            value to its column's encoding, then encodes the whole row as one msgpack array with a
+            single encoder call, which is much faster for wide schemas of small columns, at the
+            cost of samples some 10-20% larger before compression (which recovers most of the
+            difference). Requires ``msgspec``. Shards written this way are marked as version 3,
+            which readers do not support yet. Defaults to ``per_column``.
     """
 
     format = 'mds'
     extra_bytes_per_sample = 4
+    lazy_local = True
 
     def __init__(self,
                  *,
@@ -47,7 +128,16 @@ class MDSWriter(JointWriter):
                  keep_local: bool = False,
                  compression: Optional[str] = None,
                  hashes: Optional[List[str]] = None,
-                 size_limit: Optional[int] = 1 << 26) -> None:
+                 size_limit: Optional[int] = 1 << 26,
+                 compression_workers: int = 0,
+                 row_format: str = 'per_column') -> None:
+        if compression_workers < 0:
+            raise ValueError('Compression workers, if provided, must be non-negative.')
+        if row_format not in {'per_column', 'msgpack'}:
+            raise ValueError(f'Unsupported row format: {row_format}.')
+        if row_format == 'msgpack' and msgspec is None:
+            raise ImportError('The msgpack row format requires msgspec. Install it with `pip ' +
+                              'install mosaicml-streaming[msgpack]`.')
         super().__init__(local=local,
                          remote=remote,
                          keep_local=keep_local,
@@ -56,9 +146,11 @@ class MDSWriter(JointWriter):
                          size_limit=size_limit,
                          extra_bytes_per_sample=self.extra_bytes_per_sample)
         self.columns = columns
+        self.row_format = row_format
         self.column_names = []
         self.column_encodings = []
         self.column_sizes = []
+        self._encoders = []
         for name in sorted(columns):
             encoding = columns[name]
             if not is_mds_encoding(encoding):
@@ -68,13 +160,49 @@ class MDSWriter(JointWriter):
             self.column_names.append(name)
             self.column_encodings.append(encoding)
             self.column_sizes.append(size)
+            self._encoders.append(get_mds_encoder(encoding))
+
+        # Only variable-sized columns get a size header slot in each encoded sample.
+        self._var_indices = tuple(i for i, size in enumerate(self.column_sizes) if size is None)
+        self._all_fixed = not self._var_indices
+
+        # Samples made up entirely of fixed-size numbers can be packed with a single struct call.
+        formats = [get_mds_struct_format(encoding) for encoding in self.column_encodings]
+        fixed_formats = [fmt for fmt in formats if fmt is not None]
+        if row_format == 'per_column' and formats and len(fixed_formats) == len(formats):
+            self._fixed_struct = struct.Struct('<' + ''.join(fixed_formats))
+        else:
+            self._fixed_struct = None
+
+        # With msgpack rows, each column's values are first held to its encoding.
+        if row_format == 'msgpack' and msgspec is not None:
+            self._row_encoder = msgspec.msgpack.Encoder()
+            self._row_prepares = [
+                _get_msgpack_prepare(encoding, encoder)
+                for encoding, encoder in zip(self.column_encodings, self._encoders)
+            ]
+        else:
+            self._row_encoder = None
+            self._row_prepares = []
 
+        # The configuration is fixed from here on, so build and serialize it once. Shard flushes
+        # only ever use these cached forms.
+        self._config_obj: Optional[Dict[str, Any]] = None
         obj = self.get_config()
         text = json.dumps(obj, sort_keys=True)
         self.config_data = text.encode('utf-8')
         self.extra_bytes_per_shard = 4 + 4 + len(self.config_data)
         self._reset_cache()
 
+        # Shards being compressed in the background: (future, shard metadata, basename to upload).
+        # Uncompressed shards are just saved, which is not worth a round trip to a worker.
+        self.compression_workers = compression_workers
+        if compression_workers and self.compression:
+            self._pool = ProcessPoolExecutor(compression_workers)
+        else:
+            self._pool = None
+        self._pending: List[Tuple[Future, Dict[str, Any], str]] = []
+
     def encode_sample(self, sample: Dict[str, Any]) -> bytes:
         """Encode a sample dict to bytes.
 
@@ -84,37 +212,113 @@ class MDSWriter(JointWriter):
         Returns:
             bytes: Sample encoded as bytes.
         """
-        sizes = []
+        if self._row_encoder:
+            row = [
+                prepare(sample[key]) for key, prepare in zip(self.column_names, self._row_prepares)
+            ]
+            return self._row_encoder.encode(row)
+
+        if self._fixed_struct:
+            try:
+                return self._fixed_struct.pack(*[sample[key] for key in self.column_names])
+            except (struct.error, TypeError, OverflowError):
+                # Values that struct cannot pack exactly (pre-encoded bytes, floats for integer
+                # columns, out of range numbers, etc.) are left to the per-column encoders.
+                pass
+
+        head = bytearray(4 * len(self._var_indices))
+        head_offset = 0
         data = []
-        for key, encoding, size in zip(self.column_names, self.column_encodings,
-                                       self.column_sizes):
+        for key, encoding, encoder, size in zip(self.column_names, self.column_encodings,
+                                                self._encoders, self.column_sizes):
             value = sample[key]
-            datum = mds_encode(encoding, value)
+            datum = value if isinstance(value, bytes) else encoder(value)
             if size is None:
-                size = len(datum)
-                sizes.append(size)
-            else:
-                if size != len(datum):
-                    raise KeyError(f'Unexpected data size; was this data typed with the correct ' +
-                                   f'encoding ({encoding})?')
+                struct.pack_into('<I', head, head_offset, len(datum))
+                head_offset += 4
+            elif size != len(datum):
+                raise KeyError(f'Unexpected data size; was this data typed with the correct ' +
+                               f'encoding ({encoding})?')
             data.append(datum)
-        head = np.array(sizes, np.uint32).tobytes()
         body = b''.join(data)
-        return head + body
+        if self._all_fixed:
+            return body
+        return bytes(head) + body
 
     def get_config(self) -> Dict[str, Any]:
         """Get object describing shard-writing configuration.
 
+        This is built once and then cached, as it is needed on every shard flush.
+
         Returns:
             Dict[str, Any]: JSON object.
         """
-        obj = super().get_config()
-        obj.update({
-            'column_names': self.column_names,
-            'column_encodings': self.column_encodings,
-            'column_sizes': self.column_sizes
-        })
-        return obj
+        if self._config_obj is None:
+            obj = super().get_config()
+            obj.update({
+                'column_names': self.column_names,
+                'column_encodings': self.column_encodings,
+                'column_sizes': self.column_sizes
+            })
+            if self.row_format != 'per_column':
+                # Not readable as version 2 MDS, so keep current readers from trying.
+                obj['version'] = 3
+                obj['row_format'] = self.row_format
+            self._config_obj = obj
+        return self._config_obj
+
+    def _reset_cache(self) -> None:
+        """Reset our internal shard-building cache.
+
+        This is called on init or after writing a shard.
+        """
+        super()._reset_cache()
+        self._shard_fp: Optional[IO[bytes]] = None
+        self._sample_ends = array('I')
+
+    def write(self, sample: Dict[str, Any]) -> None:
+        """Write a sample.
+
+        May flush an entire new shard, then appends the sample to the shard's temporary file.
+
+        Args:
+            sample (Dict[str, Any]): Sample dict.
+        """
+        if not self._local_ready:
+            self._prepare_local()
+        new_sample = self.encode_sample(sample)
+        new_sample_size = len(new_sample) + self.extra_bytes_per_sample
+        if self.size_limit and self.size_limit < self.new_shard_size + new_sample_size:
+            self.flush_shard()
+            self._reset_cache()
+        if self._shard_fp is None:
+            raw_basename, _ = self._name_next_shard()
+            filename = os.path.join(self.local, f'{raw_basename}.tmp')
+            self._shard_fp = open(filename, 'wb+')
+        self._shard_fp.write(new_sample)
+        end = self._sample_ends[-1] if self._sample_ends else 0
+        self._sample_ends.append(end + len(new_sample))
+        self.new_shard_size += new_sample_size
+
+    def _encode_shard_header(self) -> bytes:
+        """Encode the header of a joint shard (sample count, sample offsets, and config).
+
+        Returns:
+            bytes: Header data.
+        """
+        num_samples = len(self._sample_ends)
+        header_size = 4 + 4 * (num_samples + 1) + len(self.config_data)
+        ends = np.frombuffer(self._sample_ends, np.uint32)
+        offsets = np.concatenate([[0], ends]).astype(np.int64) + header_size
+        return struct.pack('<I', num_samples) + offsets.astype('<u4').tobytes() + self.config_data
+
+    def _discard_shard_file(self) -> None:
+        """Close and remove the temporary file of the cached samples, if any."""
+        if self._shard_fp is None:
+            return
+        self._shard_fp.close()
+        os.remove(self._shard_fp.name)
+        self._shard_fp = None
 
     def encode_joint_shard(self) -> bytes:
         """Encode a joint shard out of the cached samples (single file).
@@ -122,9 +326,96 @@ class MDSWriter(JointWriter):
         Returns:
             bytes: File data.
         """
-        num_samples = np.uint32(len(self.new_samples))
-        sizes = list(map(len, self.new_samples))
-        offsets = np.array([0] + sizes).cumsum().astype(np.uint32)
-        offsets += len(num_samples.tobytes()) + len(offsets.tobytes()) + len(self.config_data)
-        sample_data = b''.join(self.new_samples)
-        return num_samples.tobytes() + offsets.tobytes() + self.config_data + sample_data
+        header = self._encode_shard_header()
+        if self._shard_fp is None:
+            return header
+        self._shard_fp.seek(0)
+        sample_data = self._shard_fp.read()
+        return header + sample_data
+
+    def _save_joint_shard(self, basename: str) -> Dict[str, Any]:
+        """Save the cached samples as a joint shard file, hashing it as it is written.
+
+        The samples are copied out of their temporary file in chunks, which is then removed.
+
+        Args:
+            basename (str): Basename of the shard file.
+
+        Returns:
+            Dict[str, Any]: File metadata.
+        """
+        header = self._encode_shard_header()
+        payload_size = self._sample_ends[-1] if self._sample_ends else 0
+        size = len(header) + payload_size
+        filename = os.path.join(self.local, basename)
+        with ChunkHasher(size, self.hashes) as hasher, open(filename, 'wb') as out:
+            out.write(header)
+            hasher.update(header)
+            if self._shard_fp is not None:
+                self._shard_fp.seek(0)
+                while True:
+                    chunk = self._shard_fp.read(_COPY_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    hasher.update(chunk)
+            digests = hasher.hexdigests()
+        self._discard_shard_file()
+        return {'basename': basename, 'bytes': size, 'hashes': digests}
+
+    def _finalize_pending(self, max_pending: int) -> None:
+        """Wait for background shards to finish, oldest first, until few enough remain.
+
+        Args:
+            max_pending (int): Maximum number of shards left in flight.
+        """
+        while max_pending < len(self._pending):
+            future, obj, basename = self._pending.pop(0)
+            obj['raw_data'], obj['zip_data'] = future.result()
+            self.upload(basename)
+
+    def flush_shard(self) -> None:
+        raw_data_basename, zip_data_basename = self._name_next_shard()
+
+        # Reserve this shard's place in the index now, as with a pool its file metadata is only
+        # filled in on finalize.
+        obj = {'samples': len(self._sample_ends), 'raw_data': None, 'zip_data': None}
+        obj.update(self.get_config())
+        self.shards.append(obj)
+        basename = zip_data_basename or raw_data_basename
+
+        if not self._pool:
+            if zip_data_basename:
+                # Compression needs the whole shard in memory anyway, so build it there instead of
+                # saving it uncompressed first.
+                raw_data = self.encode_joint_shard()
+                self._discard_shard_file()
+                obj['raw_data'], obj['zip_data'] = self._process_file(
+                    raw_data, raw_data_basename, zip_data_basename)
+            else:
+                obj['raw_data'] = self._save_joint_shard(raw_data_basename)
+            self.upload(basename)
+            return
+
+        # The saved uncompressed shard is handed off to a worker.
+        raw_info = self._save_joint_shard(raw_data_basename)
+        future = self._pool.submit(process_shard_file, raw_info, zip_data_basename, self.local,
+                                   self.compression, self.hashes)
+        self._pending.append((future, obj, basename))
+
+        # Bound the number of shards in flight while waiting on workers.
+        self._finalize_pending(2 * self.compression_workers)
+
+    def finish(self) -> None:
+        """Finish writing samples."""
+        self._prepare_local()
+        if self._sample_ends:
+            self.flush_shard()
+            self._reset_cache()
+        if self._pool:
+            try:
+                self._finalize_pending(0)
+            finally:
+                self._pool.shutdown()
+                self._pool = None
+        super().finish()
@@ -4,6 +4,8 @@
 """:class:`XSVWriter` writes samples to `.xsv` files that can be read by :class:`XSVReader`."""
 
 import json
+import struct
+from itertools import chain
 from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
@@ -114,12 +116,13 @@ class XSVWriter(SplitWriter):
         data = b''.join([header] + self.new_samples)
         header_offset = len(header)
 
-        num_samples = np.uint32(len(self.new_samples))
-        sizes = list(map(len, self.new_samples))
-        offsets = header_offset + np.array([0] + sizes).cumsum().astype(np.uint32)
+        num_samples = struct.pack('<I', len(self.new_samples))
+        offsets = np.fromiter(chain([header_offset], map(len, self.new_samples)), np.uint32,
+                              len(self.new_samples) + 1)
+        np.cumsum(offsets, out=offsets)
         obj = self.get_config()
         text = json.dumps(obj, sort_keys=True)
-        meta = num_samples.tobytes() + offsets.tobytes() + text.encode('utf-8')
+        meta = num_samples + offsets.tobytes() + text.encode('utf-8')
 
         return data, meta
 
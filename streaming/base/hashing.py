@@ -8,7 +8,7 @@ from typing import Any, Callable, Dict, Set
 
 import xxhash
 
-__all__ = ['get_hash', 'get_hashes', 'is_hash']
+__all__ = ['get_hash', 'get_hasher', 'get_hashes', 'is_hash']
 
 
 def _collect() -> Dict[str, Callable[[bytes], Any]]:
@@ -66,3 +66,18 @@ def get_hash(algo: str, data: bytes) -> str:
         raise ValueError(f'{algo} is not a supported hash algorithm.')
     func = _hashes[algo]
     return func(data).hexdigest()
+
+
+def get_hasher(algo: str) -> Any:
+    """Get a new hash object, for hashing data incrementally.
+
+    Args:
+        algo (str): Hash algorithm.
+
+    Returns:
+        Any: Hash object, with ``update()`` and ``hexdigest()`` methods.
+    """
+    if not is_hash(algo):
+        raise ValueError(f'{algo} is not a supported hash algorithm.')
+    func = _hashes[algo]
+    return func()
@@ -50,7 +50,11 @@ class Index(object):
         shard = 0
         slots = []
         for slot in range(self.num_slots):
-            slot_end = (slot + 1) * self.slot_size
+            slot_begin = slot * self.slot_size
+            slot_end = slot_begin + self.slot_size
+            # Skip empty shards, so that the slot starts in the shard holding its first sample.
+            while shard_ends[shard] <= slot_begin:
+                shard += 1
             if shard_ends[shard] < slot_end:
                 div = shard_ends[shard]
                 slots.append((shard, div))
@@ -78,6 +82,18 @@ class Index(object):
         offset = idx - self.shard_offsets[shard]
         return shard, offset  # pyright: ignore
 
+    def get_shard_span(self, shard: int) -> Tuple[int, int]:
+        """Get the range of global sample IDs that live in a shard.
+
+        Args:
+            shard (int): Shard index.
+
+        Returns:
+            Tuple[int, int]: First sample ID and one past the last sample ID.
+        """
+        begin = int(self.shard_offsets[shard])
+        return begin, begin + int(self.samples_per_shard[shard])
+
     def get_samples_per_device(self) -> int:
         """Get the per-device dataset size (i.e., IterableDataset.__len__).
 
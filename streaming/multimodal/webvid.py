@@ -4,13 +4,115 @@
 """A streaming WebVid dataset."""
 
 import os
-from time import sleep
-from typing import Any, Optional
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from numpy.typing import NDArray
 
 from streaming.base import StreamingDataset
 from streaming.base.dataset import TICK, _PartitionState
 from streaming.base.storage import download
 
+# Size of each read when loading an extra file.
+_READ_SIZE = 1 << 22
+
+
+def _read_local_or_fetch(local: str, remote: str, timeout: float) -> bytes:
+    """Read an extra file from local, first downloading it from remote if it is not present.
+
+    Opens the file directly instead of checking that it exists first, and reads to EOF without
+    a stat, to keep the cache-hit path to a minimum of syscalls.
+
+    Args:
+        local (str): Local path.
+        remote (str): Remote path.
+        timeout (float): How long to wait for the file to download before raising an exception.
+
+    Returns:
+        bytes: File contents.
+    """
+    try:
+        fd = os.open(local, os.O_RDONLY)
+    except FileNotFoundError:
+        download(remote, local, timeout)
+        fd = os.open(local, os.O_RDONLY)
+    try:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        chunks = []
+        while True:
+            chunk = os.read(fd, _READ_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+    return b''.join(chunks)
+
+
+def _get_extra_prefixes(extra_local: Optional[str],
+                        extra_remote: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Get the local and remote prefixes that extra file paths are joined to by concatenation.
+
+    Plain concatenation is much cheaper than ``os.path.join``, which matters in per-sample paths.
+
+    Args:
+        extra_local (str, optional): Base destination of extra local sample downloads.
+        extra_remote (str, optional): Base source of extra remote sample downloads.
+
+    Returns:
+        Optional[Tuple[str, str]]: Local and remote prefixes, or ``None`` if there are no extra
+            files or the path separator is not ``/``, in which case use ``os.path.join``.
+    """
+    if not extra_local or not extra_remote or os.sep != '/':
+        return None
+    return extra_local.rstrip('/') + '/', extra_remote.rstrip('/') + '/'
+
+
+class _Claim(Future):
+    """Placeholder for an extra file that __getitem__ is fetching itself, resolved when done."""
+
+
+class _ExtraDownloads:
+    """An epoch's extra files being downloaded ahead by the download thread, by local path.
+
+    Args:
+        cache_limit (int): Maximum total bytes of extra files read into memory ahead of
+            __getitem__.
+    """
+
+    def __init__(self, cache_limit: int) -> None:
+        self.lock = Lock()
+        self.futures: Dict[str, Future] = {}
+        self.cache_limit = cache_limit
+        self.cache_size = 0
+
+    def reserve(self, size: int) -> bool:
+        """Reserve room in memory for an extra file, if it fits.
+
+        Args:
+            size (int): File size in bytes.
+
+        Returns:
+            bool: Whether the file fits.
+        """
+        with self.lock:
+            if self.cache_limit < self.cache_size + size:
+                return False
+            self.cache_size += size
+            return True
+
+    def release(self, size: int) -> None:
+        """Release the room in memory reserved for an extra file.
+
+        Args:
+            size (int): File size in bytes.
+        """
+        with self.lock:
+            self.cache_size -= size
+
 
 class StreamingInsideWebVid(StreamingDataset):
     """Streaming WebVid dataset.
@@ -113,6 +215,7 @@ class StreamingOutsideGIWebVid(StreamingDataset):
         # Videos are stored outside of their shards here.
         self.extra_local = extra_local
         self.extra_remote = extra_remote
+        self._extra_prefixes = _get_extra_prefixes(extra_local, extra_remote)
 
     def __getitem__(self, idx: int) -> Any:
         """Get the sample at the index.
@@ -127,13 +230,14 @@ class StreamingOutsideGIWebVid(StreamingDataset):
 
         if self.extra_local and self.extra_remote:
             rel_path = obj['content_path']
-            local = os.path.join(self.extra_local, rel_path)
-            remote = os.path.join(self.extra_remote, rel_path)
-            if not os.path.exists(local):
-                download(remote, local, self.download_timeout)
-            with open(local, 'rb') as fp:
-                content = fp.read()
-            obj['content'] = content
+            if self._extra_prefixes:
+                local_prefix, remote_prefix = self._extra_prefixes
+                local = local_prefix + rel_path
+                remote = remote_prefix + rel_path
+            else:
+                local = os.path.join(self.extra_local, rel_path)
+                remote = os.path.join(self.extra_remote, rel_path)
+            obj['content'] = _read_local_or_fetch(local, remote, self.download_timeout)
 
         # Processing goes here.
 
@@ -172,6 +276,12 @@ class StreamingOutsideDTWebVid(StreamingDataset):
             partitioned over the workers. Defaults to ``None``.
         extra_local (str, optional): Base destination of extra local sample downloads.
         extra_remote (str, optional): Base source of extra remote sample downloads.
+        extra_download_concurrency (int): Maximum number of extra sample downloads in flight at
+            once in the download thread. Defaults to ``16``.
+        extra_cache_limit (int): Maximum total bytes of extra files that the download thread reads
+            into memory for __getitem__ to take. This moves the read off of __getitem__ rather
+            than saving it. Files that do not fit are read by __getitem__. Defaults to ``0``,
+            which disables this.
     """
 
     def __init__(self,
@@ -188,7 +298,13 @@ class StreamingOutsideDTWebVid(StreamingDataset):
                  num_canonical_nodes: Optional[int] = None,
                  batch_size: Optional[int] = None,
                  extra_local: Optional[str] = None,
-                 extra_remote: Optional[str] = None):
+                 extra_remote: Optional[str] = None,
+                 extra_download_concurrency: int = 16,
+                 extra_cache_limit: int = 0):
+        if extra_download_concurrency < 1:
+            raise ValueError('Extra download concurrency must be at least one.')
+        if extra_cache_limit < 0:
+            raise ValueError('Extra cache limit must be non-negative.')
         super().__init__(local, remote, split, shuffle, predownload, keep_zip, download_retry,
                          download_timeout, validate_hash, shuffle_seed, num_canonical_nodes,
                          batch_size)
@@ -196,6 +312,78 @@ class StreamingOutsideDTWebVid(StreamingDataset):
         # Videos are stored outside of their shards here.
         self.extra_local = extra_local
         self.extra_remote = extra_remote
+        self._extra_prefixes = _get_extra_prefixes(extra_local, extra_remote)
+        self.extra_download_concurrency = extra_download_concurrency
+        self.extra_cache_limit = extra_cache_limit
+
+    def _prefetch_extra(self, downloads: _ExtraDownloads, local: str,
+                        remote: str) -> Optional[bytes]:
+        """Download a sample's extra file if needed, then read it into memory if there is room.
+
+        Args:
+            downloads (_ExtraDownloads): The epoch's extra downloads.
+            local (str): Local path.
+            remote (str): Remote path.
+
+        Returns:
+            Optional[bytes]: File contents, or ``None`` if left on disk.
+        """
+        if not os.path.exists(local):
+            download(remote, local, self.download_timeout)
+        if not downloads.cache_limit:
+            return None
+        size = os.path.getsize(local)
+        if not downloads.reserve(size):
+            return None
+        try:
+            return _read_local_or_fetch(local, remote, self.download_timeout)
+        except:
+            downloads.release(size)
+            raise
+
+    def _fetch_extra(self, local: str, remote: str) -> bytes:
+        """Read a sample's extra file, downloading it if needed, in step with the download thread.
+
+        Args:
+            local (str): Local path.
+            remote (str): Remote path.
+
+        Returns:
+            bytes: File contents.
+        """
+        downloads = getattr(self, '_extra_downloads', None)
+        if downloads is None:
+            return _read_local_or_fetch(local, remote, self.download_timeout)
+
+        claim = _Claim()
+        with downloads.lock:
+            future = downloads.futures.get(local)
+            if future is None:
+                downloads.futures[local] = claim
+            elif not isinstance(future, _Claim):
+                del downloads.futures[local]
+
+        if future is not None:
+            # The download thread or another caller is fetching this file, so wait for it instead
+            # of racing it to the same temporary file. Take the file from memory if it was read
+            # there. Should that download have failed, we fetch it ourselves.
+            wait([future])
+            if future.exception() is None:
+                data = future.result()
+                if data is not None:
+                    downloads.release(len(data))
+                    return data
+            return _read_local_or_fetch(local, remote, self.download_timeout)
+
+        # Otherwise, the placeholder claims the file while we fetch it, so that the download
+        # thread leaves it to us. It is resolved either way, releasing any callers waiting on it.
+        try:
+            return _read_local_or_fetch(local, remote, self.download_timeout)
+        finally:
+            with downloads.lock:
+                if downloads.futures.get(local) is claim:
+                    del downloads.futures[local]
+            claim.set_result(None)
 
     def __getitem__(self, idx: int) -> Any:
         """Get the sample at the index.
@@ -210,18 +398,34 @@ class StreamingOutsideDTWebVid(StreamingDataset):
 
         if self.extra_local and self.extra_remote:
             rel_path = obj['content_path']
-            local = os.path.join(self.extra_local, rel_path)
-            remote = os.path.join(self.extra_remote, rel_path)
-            if not os.path.exists(local):
-                download(remote, local, self.download_timeout)
-            with open(local, 'rb') as fp:
-                content = fp.read()
-            obj['content'] = content
+            if self._extra_prefixes:
+                local_prefix, remote_prefix = self._extra_prefixes
+                local = local_prefix + rel_path
+                remote = remote_prefix + rel_path
+            else:
+                local = os.path.join(self.extra_local, rel_path)
+                remote = os.path.join(self.extra_remote, rel_path)
+            obj['content'] = self._fetch_extra(local, remote)
 
         # Processing goes here.
 
         return obj
 
+    def _each_sample(self, sample_ids: NDArray) -> Iterator[int]:
+        """Iterate over each sample ID, while downloading ahead in the background.
+
+        Args:
+            sample_ids (NDArray): The sample IDs to download and iterate.
+
+        Returns:
+            Iterator[int]: Each sample ID.
+        """
+        # Each epoch's download thread gets a fresh registry of its extra downloads, so that any
+        # files left in memory by the last epoch are dropped. It is created here rather than in
+        # __init__, as a threading Lock is unpickleable.
+        self._extra_downloads = _ExtraDownloads(self.extra_cache_limit)
+        yield from super()._each_sample(sample_ids)
+
     def _download_thread(self, state: _PartitionState) -> None:
         """Download the relevant shards in the background while we are being iterated.
 
@@ -234,8 +438,40 @@ class StreamingOutsideDTWebVid(StreamingDataset):
         Args:
             state (_PartitionState): The partition state.
         """
+        # Extra downloads are I/O-bound, so run several at once. The pool is created here rather
+        # than in __init__ because the dataset must stay picklable for its dataloader workers.
+        pool = ThreadPoolExecutor(self.extra_download_concurrency)
+        pending = deque()
+        downloads = self._extra_downloads
+        try:
+            self._download_loop(state, pool, pending, downloads)
+
+            # Wait for the remaining extra downloads, surfacing any errors.
+            for future in pending:
+                future.result()
+        finally:
+            # Even when raising, let the extra downloads in flight finish so none outlive this
+            # thread. __getitem__ fetches the files of any that failed itself.
+            pool.shutdown()
+
+    def _download_loop(self, state: _PartitionState, pool: ThreadPoolExecutor, pending: deque,
+                       downloads: _ExtraDownloads) -> None:
+        """Download shards and extra files for the samples of an epoch, ahead of their iteration.
+
+        Args:
+            state (_PartitionState): The partition state.
+            pool (ThreadPoolExecutor): Pool to download extra files on.
+            pending (deque): Extra downloads in flight, oldest first.
+            downloads (_ExtraDownloads): The epoch's extra downloads, for __getitem__ to wait on.
+        """
         shard_states_lock, shard_states = self._get_shard_states()
 
+        local_prefix, remote_prefix = self._extra_prefixes or ('', '')
+
+        # Span of sample IDs of the shard of the last sample, which is used to skip lookups.
+        shard_id = -1
+        shard_begin = shard_end = 0
+
         # Download loop.
         while True:
             # If we've started a new epoch early (__iter__ was called again), exit this thread
@@ -252,7 +488,7 @@ class StreamingOutsideDTWebVid(StreamingDataset):
             if self.predownload is not None:
                 samples_ahead = state.download_index - state.yield_index
                 if self.predownload <= samples_ahead:
-                    sleep(TICK)
+                    state.wait_for_yield(state.yield_index, TICK)
                     continue
 
             # If we hit -1, we skip.
@@ -261,17 +497,35 @@ class StreamingOutsideDTWebVid(StreamingDataset):
                 state.download_index += 1
                 continue
 
-            # Download and decompress the shard for this sample, if not already done.
-            shard_id, _ = self.index.find_sample(sample_id)
+            # Download and decompress the shard for this sample, if not already done. Consecutive
+            # samples tend to share a shard, so only look up the shard when we leave the last one.
+            if not shard_begin <= sample_id < shard_end:
+                shard_id, _ = self.index.find_sample(sample_id)
+                shard_begin, shard_end = self.index.get_shard_span(shard_id)
             self._download_or_skip_shard(shard_states_lock, shard_states, shard_id, False)
 
             # Predownload the sample's extra data.
             obj = super().__getitem__(sample_id)
             if self.extra_local and self.extra_remote:
                 rel_path = obj['content_path']
-                local = os.path.join(self.extra_local, rel_path)
-                remote = os.path.join(self.extra_remote, rel_path)
-                if not os.path.exists(local):
-                    download(remote, local, self.download_timeout)
+                if self._extra_prefixes:
+                    local = local_prefix + rel_path
+                    remote = remote_prefix + rel_path
+                else:
+                    local = os.path.join(self.extra_local, rel_path)
+                    remote = os.path.join(self.extra_remote, rel_path)
+                if len(pending) == self.extra_download_concurrency:
+                    pending.popleft().result()
+
+                # Only fetch files that __getitem__ has not reached (and is not fetching), which it
+                # then waits on. Checked under the lock that __getitem__ takes to look for and
+                # claim the file, so the two never both fetch it. Files are only read into memory
+                # here, for __getitem__ to take, so none are left behind the cursor.
+                with downloads.lock:
+                    if (state.yield_index < state.download_index and
+                            local not in downloads.futures):
+                        future = pool.submit(self._prefetch_extra, downloads, local, remote)
+                        downloads.futures[local] = future
+                        pending.append(future)
 
             state.download_index += 1
@@ -1,6 +1,7 @@
 # Copyright 2023 MosaicML Streaming authors
 # SPDX-License-Identifier: Apache-2.0
 
+import gzip as stdlib_gzip
 from filecmp import dircmp
 from typing import Any, Optional, Tuple, Union
 
@@ -117,6 +118,13 @@ class TestGzip:
         output = gzip.decompress(gzip.compress(data))
         assert output == data
 
+    @pytest.mark.parametrize('level', list(range(10)))
+    def test_stdlib_decomp(self, level: int):
+        data = str.encode('Hello World 789*!' * 10, encoding='utf-8')
+        gzip = Gzip(level)
+        output = stdlib_gzip.decompress(gzip.compress(data))
+        assert output == data
+
     @pytest.mark.parametrize('data', [100, 1.2, 'bigdata'])
     def test_invalid_data(self, data: Any):
         gzip = Gzip()
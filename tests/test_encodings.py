@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import json
+import struct
 import tempfile
 from typing import Any, Union
 
@@ -401,6 +402,23 @@ class TestMDSEncodings:
         output = mdsEnc.mds_encode(enc_name, data)
         assert isinstance(output, bytes)
 
+    @pytest.mark.parametrize(('enc_name', 'data'), [('bytes', b'9'), ('int', 27),
+                                                    ('str', 'mosaicml'), ('float32', 4.5),
+                                                    ('pkl', {
+                                                        'a': 1
+                                                    }), ('json', [1, 2])])
+    def test_get_mds_encoder(self, enc_name: str, data: Any):
+        encoder = mdsEnc.get_mds_encoder(enc_name)
+        output = encoder(data)
+        assert output == mdsEnc.mds_encode(enc_name, data)
+
+    @pytest.mark.parametrize(('enc_name', 'data'), [('bytes', 9), ('bytes', bytearray(b'9')),
+                                                    ('str', 12.5), ('str', b'mosaicml')])
+    def test_get_mds_encoder_invalid_data(self, enc_name: str, data: Any):
+        encoder = mdsEnc.get_mds_encoder(enc_name)
+        with pytest.raises(AttributeError):
+            _ = encoder(data)
+
     @pytest.mark.parametrize(('enc_name', 'data'), [('bytes', 9), ('int', '27'), ('str', 12.5)])
     def test_mds_encode_invalid_data(self, enc_name: str, data: Any):
         with pytest.raises(AttributeError):
@@ -418,6 +436,33 @@ class TestMDSEncodings:
         output = mdsEnc.get_mds_encoded_size(enc_name)
         assert output is expected_size
 
+    @pytest.mark.parametrize('enc_name', [
+        'uint8', 'uint16', 'uint32', 'uint64', 'int8', 'int16', 'int32', 'int64', 'float16',
+        'float32', 'float64'
+    ])
+    def test_get_mds_struct_format(self, enc_name: str):
+        fmt = mdsEnc.get_mds_struct_format(enc_name)
+        assert fmt is not None
+        assert struct.calcsize('<' + fmt) == mdsEnc.get_mds_encoded_size(enc_name)
+        assert struct.pack('<' + fmt, 42) == mdsEnc.mds_encode(enc_name, 42)
+
+    @pytest.mark.parametrize('enc_name', ['bytes', 'str', 'int', 'pkl'])
+    def test_get_mds_struct_format_none(self, enc_name: str):
+        assert mdsEnc.get_mds_struct_format(enc_name) is None
+
+    @pytest.mark.parametrize('enc_name', [
+        'uint8', 'uint16', 'uint32', 'uint64', 'int8', 'int16', 'int32', 'int64', 'float16',
+        'float32', 'float64'
+    ])
+    def test_get_mds_scalar_dtype(self, enc_name: str):
+        dtype = mdsEnc.get_mds_scalar_dtype(enc_name)
+        assert dtype is not None
+        assert np.dtype(dtype).name == enc_name
+
+    @pytest.mark.parametrize('enc_name', ['bytes', 'str', 'int', 'pkl'])
+    def test_get_mds_scalar_dtype_none(self, enc_name: str):
+        assert mdsEnc.get_mds_scalar_dtype(enc_name) is None
+
 
 class TestXSVEncodings:
 
@@ -42,3 +42,16 @@ def test_get_hash(algo_name: str, data: bytes, expected_output: str):
 def test_get_hash_invalid_algo(algo_name: str, data: bytes):
     with pytest.raises(ValueError):
         _ = shash.get_hash(algo_name, data)
+
+
+@pytest.mark.parametrize('algo_name', ['md5', 'sha3_256', 'xxh3_64'])
+def test_get_hasher(algo_name: str):
+    hasher = shash.get_hasher(algo_name)
+    hasher.update(b'hel')
+    hasher.update(b'lo')
+    assert hasher.hexdigest() == shash.get_hash(algo_name, b'hello')
+
+
+def test_get_hasher_invalid_algo():
+    with pytest.raises(ValueError):
+        _ = shash.get_hasher('fake')
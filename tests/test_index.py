@@ -0,0 +1,31 @@
+# Copyright 2023 MosaicML Streaming authors
+# SPDX-License-Identifier: Apache-2.0
+
+from typing import List
+
+import numpy as np
+import pytest
+
+from streaming.base.index import Index
+
+
+@pytest.mark.parametrize(
+    'samples_per_shard',
+    [[5], [3, 3, 3], [4, 2, 7, 1], [6, 6, 3], [0, 3], [2, 0, 5], [3, 0, 0, 4, 0], [0, 0, 5, 0]])
+def test_get_shard_span(samples_per_shard: List[int]):
+    index = Index(np.array(samples_per_shard, np.int64))
+
+    # The spans of the shards tile the sample IDs in order, with empty shards spanning nothing.
+    begin = 0
+    for shard, num_samples in enumerate(samples_per_shard):
+        assert index.get_shard_span(shard) == (begin, begin + num_samples)
+        begin += num_samples
+    assert begin == index.total_samples
+
+    # Every sample, including those on either side of each shard boundary, is found in the shard
+    # whose span holds it.
+    for idx in range(index.total_samples):
+        shard, offset = index.find_sample(idx)
+        shard_begin, shard_end = index.get_shard_span(shard)
+        assert shard_begin <= idx < shard_end
+        assert offset == idx - shard_begin
@@ -0,0 +1,264 @@
+# Copyright 2023 MosaicML Streaming authors
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+from threading import Event, Lock, Thread, Timer
+from time import sleep
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pytest
+
+import streaming.multimodal.webvid as webvid
+from streaming.base import StreamingDataset
+from streaming.base.dataset import _PartitionState
+from streaming.base.world import World
+from streaming.multimodal.webvid import StreamingOutsideDTWebVid
+
+
+@pytest.mark.parametrize('read_size', [7, 1 << 22])
+def test_read_local_or_fetch_hit(tmp_path: Any, monkeypatch: Any, read_size: int):
+    monkeypatch.setattr(webvid, '_READ_SIZE', read_size)
+    local = os.path.join(tmp_path, 'local.bin')
+    data = bytes(range(256)) * 3
+    with open(local, 'wb') as out:
+        out.write(data)
+
+    # The remote does not exist, so it must not be touched.
+    remote = os.path.join(tmp_path, 'missing.bin')
+    assert webvid._read_local_or_fetch(local, remote, 10) == data
+
+
+def test_read_local_or_fetch_miss(tmp_path: Any):
+    remote = os.path.join(tmp_path, 'remote', 'dir', 'sample.bin')
+    os.makedirs(os.path.dirname(remote))
+    data = bytes(range(256)) * 3
+    with open(remote, 'wb') as out:
+        out.write(data)
+
+    local = os.path.join(tmp_path, 'local', 'dir', 'sample.bin')
+    assert webvid._read_local_or_fetch(local, remote, 10) == data
+    with open(local, 'rb') as in_file:
+        assert in_file.read() == data
+
+
+@pytest.mark.skipif(os.sep != '/', reason='Prefixes are only used where the separator is /.')
+@pytest.mark.parametrize(('extra_local', 'extra_remote'), [('/data/local', 's3://bucket/remote'),
+                                                           ('/data/local/', 's3://bucket/remote/'),
+                                                           ('local', '/data/remote/'),
+                                                           ('local/', '/data/remote')])
+def test_get_extra_prefixes(extra_local: str, extra_remote: str):
+    prefixes = webvid._get_extra_prefixes(extra_local, extra_remote)
+    assert prefixes is not None
+    local_prefix, remote_prefix = prefixes
+    for rel_path in ['sample.mp4', 'dir/sample.mp4']:
+        assert local_prefix + rel_path == os.path.join(extra_local, rel_path)
+        assert remote_prefix + rel_path == os.path.join(extra_remote, rel_path)
+
+
+@pytest.mark.parametrize(('extra_local', 'extra_remote'), [(None, '/data/remote'),
+                                                           ('/data/local', None), (None, None),
+                                                           ('', '/data/remote')])
+def test_get_extra_prefixes_unset(extra_local: Optional[str], extra_remote: Optional[str]):
+    assert webvid._get_extra_prefixes(extra_local, extra_remote) is None
+
+
+class _FakeIndex:
+    """Index of a single shard holding every sample."""
+
+    def __init__(self, num_samples: int) -> None:
+        self.num_samples = num_samples
+
+    def find_sample(self, idx: int) -> Any:
+        return 0, idx
+
+    def get_shard_span(self, shard: int) -> Any:
+        return 0, self.num_samples
+
+
+def _make_dt_webvid(tmp_path: Any, monkeypatch: Any, num_samples: int,
+                    **kwargs: Any) -> StreamingOutsideDTWebVid:
+    """Make a DT WebVid dataset over fake shards, whose samples each point to an extra file."""
+    extra_remote = os.path.join(tmp_path, 'remote')
+    os.makedirs(extra_remote)
+    for idx in range(num_samples):
+        with open(os.path.join(extra_remote, f'{idx}.bin'), 'wb') as out:
+            out.write(bytes([idx]) * 100)
+
+    # Skip StreamingDataset.__init__, which needs a real dataset, and stub out its shards.
+    monkeypatch.setattr(StreamingDataset, '__getitem__',
+                        lambda self, idx: {'content_path': f'{idx}.bin'})
+    dataset = StreamingOutsideDTWebVid.__new__(StreamingOutsideDTWebVid)
+    dataset._rank_world = World()
+    dataset.predownload = None
+    dataset.download_timeout = 10
+    dataset.index = _FakeIndex(num_samples)
+    dataset._get_shard_states = lambda: (None, None)
+    dataset._download_or_skip_shard = lambda *args: None
+    dataset.extra_local = os.path.join(tmp_path, 'local')
+    dataset.extra_remote = extra_remote
+    dataset._extra_prefixes = webvid._get_extra_prefixes(dataset.extra_local, extra_remote)
+    dataset.extra_download_concurrency = kwargs.get('extra_download_concurrency', 4)
+    dataset.extra_cache_limit = kwargs.get('extra_cache_limit', 0)
+    dataset._extra_downloads = webvid._ExtraDownloads(dataset.extra_cache_limit)
+    return dataset
+
+
+def test_download_thread_window(tmp_path: Any, monkeypatch: Any):
+    dataset = _make_dt_webvid(tmp_path, monkeypatch, 50, extra_download_concurrency=3)
+    lock = Lock()
+    in_flight = [0]
+    max_in_flight = [0]
+    downloads: List[str] = []
+    real_download = webvid.download
+
+    def download(remote: str, local: str, timeout: float) -> None:
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            downloads.append(local)
+        real_download(remote, local, timeout)
+        with lock:
+            in_flight[0] -= 1
+
+    monkeypatch.setattr(webvid, 'download', download)
+    state = _PartitionState(np.arange(50))
+    dataset._download_thread(state)
+
+    # The sample at the yield cursor is left to __getitem__, and the rest are fetched once each.
+    expected = [os.path.join(dataset.extra_local, f'{idx}.bin') for idx in range(1, 50)]
+    assert sorted(downloads) == sorted(expected)
+    assert max_in_flight[0] <= 3
+    for idx in range(50):
+        assert dataset[idx]['content'] == bytes([idx]) * 100
+    assert not dataset._extra_downloads.futures
+
+
+def test_download_thread_error(tmp_path: Any, monkeypatch: Any):
+    dataset = _make_dt_webvid(tmp_path, monkeypatch, 50, extra_download_concurrency=2)
+    started: List[str] = []
+
+    def download(remote: str, local: str, timeout: float) -> None:
+        started.append(local)
+        raise RuntimeError('Download failed')
+
+    monkeypatch.setattr(webvid, 'download', download)
+    state = _PartitionState(np.arange(50))
+    with pytest.raises(RuntimeError):
+        dataset._download_thread(state)
+
+    # The window stopped further downloads, and the ones in flight were waited for.
+    assert len(started) <= 3
+    assert all(future.done() for future in dataset._extra_downloads.futures.values())
+
+
+def test_getitem_waits_for_download_thread(tmp_path: Any, monkeypatch: Any):
+    dataset = _make_dt_webvid(tmp_path, monkeypatch, 2)
+    release = Event()
+    downloads: Dict[str, int] = {}
+    real_download = webvid.download
+
+    def download(remote: str, local: str, timeout: float) -> None:
+        downloads[local] = downloads.get(local, 0) + 1
+        release.wait()
+        real_download(remote, local, timeout)
+
+    monkeypatch.setattr(webvid, 'download', download)
+    state = _PartitionState(np.arange(2))
+    thread = Thread(target=dataset._download_thread, args=(state,), daemon=True)
+    thread.start()
+    while not dataset._extra_downloads.futures:
+        sleep(0.01)
+
+    # Sample 1 is being fetched by the download thread, so __getitem__ must wait for that.
+    state.yield_index = 1
+    Timer(0.1, release.set).start()
+    assert dataset[1]['content'] == bytes([1]) * 100
+    thread.join()
+    assert downloads == {os.path.join(dataset.extra_local, '1.bin'): 1}
+
+
+def test_getitem_concurrent_readers(tmp_path: Any, monkeypatch: Any):
+    dataset = _make_dt_webvid(tmp_path, monkeypatch, 1)
+    release = Event()
+    downloads: List[str] = []
+    real_download = webvid.download
+
+    def download(remote: str, local: str, timeout: float) -> None:
+        downloads.append(local)
+        release.wait()
+        real_download(remote, local, timeout)
+
+    monkeypatch.setattr(webvid, 'download', download)
+    results: Dict[str, Any] = {}
+
+    def read(name: str) -> None:
+        try:
+            results[name] = dataset[0]['content']
+        except Exception as err:
+            results[name] = err
+
+    # The first reader claims the file, and the second waits on that instead of fetching it too.
+    first = Thread(target=read, args=('first',), daemon=True)
+    first.start()
+    while not downloads:
+        sleep(0.01)
+    second = Thread(target=read, args=('second',), daemon=True)
+    second.start()
+    Timer(0.1, release.set).start()
+    first.join(10)
+    second.join(10)
+    assert not first.is_alive() and not second.is_alive()
+    assert results == {'first': bytes([0]) * 100, 'second': bytes([0]) * 100}
+    assert len(downloads) == 1
+    assert not dataset._extra_downloads.futures
+
+
+def test_extra_downloads_reserve_release():
+    downloads = webvid._ExtraDownloads(250)
+    assert downloads.reserve(100)
+    assert downloads.reserve(100)
+    assert not downloads.reserve(100)
+    assert downloads.cache_size == 200
+    downloads.release(100)
+    assert downloads.reserve(100)
+    assert downloads.cache_size == 200
+
+
+@pytest.mark.parametrize('extra_cache_limit', [0, 250, 1000])
+def test_download_thread_cache(tmp_path: Any, monkeypatch: Any, extra_cache_limit: int):
+    dataset = _make_dt_webvid(tmp_path, monkeypatch, 5, extra_cache_limit=extra_cache_limit)
+    state = _PartitionState(np.arange(5))
+    dataset._download_thread(state)
+
+    # Files are read into memory while they fit in the budget, and the rest are left on disk.
+    downloads = dataset._extra_downloads
+    cached = [
+        int(os.path.basename(local).split('.')[0])
+        for local, future in downloads.futures.items()
+        if future.result() is not None
+    ]
+    assert len(cached) == min(extra_cache_limit // 100, 4)
+    assert downloads.cache_size == 100 * len(cached)
+
+    # __getitem__ takes the files from memory, releasing their room.
+    for idx in range(1, 5):
+        os.remove(os.path.join(dataset.extra_local, f'{idx}.bin'))
+    monkeypatch.setattr(webvid, 'download', lambda *args: None)
+    for idx in cached:
+        assert dataset[idx]['content'] == bytes([idx]) * 100
+    assert downloads.cache_size == 0
+    assert len(downloads.futures) == 4 - len(cached)
+
+
+def test_download_thread_cache_behind_cursor(tmp_path: Any, monkeypatch: Any):
+    dataset = _make_dt_webvid(tmp_path, monkeypatch, 10, extra_cache_limit=1000)
+    state = _PartitionState(np.arange(10))
+    state.yield_index = 4
+    dataset._download_thread(state)
+
+    # Samples that __getitem__ has already reached are never read into memory for it.
+    downloads = dataset._extra_downloads
+    expected = [os.path.join(dataset.extra_local, f'{idx}.bin') for idx in range(5, 10)]
+    assert sorted(downloads.futures) == sorted(expected)
+    assert downloads.cache_size == 500
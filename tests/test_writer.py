@@ -1,21 +1,32 @@
 # Copyright 2023 MosaicML Streaming authors
 # SPDX-License-Identifier: Apache-2.0
 
+import json
 import logging
 import math
 import os
-from typing import Any, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import pytest
 
+import streaming.base.format.mds.writer as mds_writer
 from streaming import CSVWriter, JSONWriter, MDSWriter, StreamingDataset, TSVWriter, XSVWriter
+from streaming.base.compression import decompress
+from streaming.base.format.base.writer import get_file_info, hash_chunks
+from streaming.base.format.mds.encodings import mds_encode
+from streaming.base.hashing import get_hash
 from tests.common.datasets import NumberAndSayDataset, SequenceDataset
 from tests.common.utils import get_config_in_bytes
 
 logger = logging.getLogger(__name__)
 
 
+def _fail_shard_file(*args: Any) -> None:
+    """Stand in for processing a shard file in a worker, which fails."""
+    raise RuntimeError('Shard processing failed')
+
+
 class TestMDSWriter:
 
     @pytest.mark.parametrize('num_samples', [100])
@@ -42,6 +53,245 @@ class TestMDSWriter:
                            size_limit=size_limit)
         assert writer.get_config() == expected_config
 
+    @pytest.mark.parametrize(('columns', 'sample', 'expected'), [
+        ({
+            'a': 'int32',
+            'b': 'float64'
+        }, {
+            'a': 7,
+            'b': 0.5
+        }, np.int32(7).tobytes() + np.float64(0.5).tobytes()),
+        ({
+            'a': 'int32',
+            'b': 'str',
+            'c': 'bytes'
+        }, {
+            'a': 7,
+            'b': 'hello',
+            'c': b'\x01\x02'
+        }, np.array([5, 2], np.uint32).tobytes() + np.int32(7).tobytes() + b'hello\x01\x02'),
+    ],
+                             ids=['fixed', 'mixed'])
+    def test_encode_sample(self, remote_local: Tuple[str, str], columns: Dict[str, str],
+                           sample: Dict[str, Any], expected: bytes) -> None:
+        local, _ = remote_local
+        writer = MDSWriter(local=local, columns=columns)
+        assert writer.encode_sample(sample) == expected
+
+    @pytest.mark.parametrize(('columns', 'sample'), [
+        ({
+            'a': 'uint8',
+            'b': 'int32',
+            'c': 'uint64'
+        }, {
+            'a': 255,
+            'b': -3,
+            'c': np.uint64(2**40)
+        }),
+        ({
+            'a': 'float16',
+            'b': 'float32',
+            'c': 'float64'
+        }, {
+            'a': 0.1,
+            'b': np.float32(1.1),
+            'c': -2.75
+        }),
+        ({
+            'a': 'float16',
+            'b': 'float32'
+        }, {
+            'a': 1e39,
+            'b': 1e39
+        }),
+        ({
+            'a': 'int16',
+            'b': 'float32'
+        }, {
+            'a': 2.5,
+            'b': 3
+        }),
+        ({
+            'a': 'int16',
+            'b': 'float32'
+        }, {
+            'a': b'\x01\x00',
+            'b': 3
+        }),
+    ],
+                             ids=['ints', 'floats', 'overflow', 'cast', 'bytes'])
+    def test_encode_sample_fixed_struct(self, remote_local: Tuple[str, str],
+                                        columns: Dict[str, str], sample: Dict[str, Any]) -> None:
+        local, _ = remote_local
+        writer = MDSWriter(local=local, columns=columns)
+        assert writer._fixed_struct is not None
+        expected = b''.join([mds_encode(columns[key], sample[key]) for key in sorted(columns)])
+        assert writer.encode_sample(sample) == expected
+
+    @pytest.mark.parametrize('columns', [{'a': 'int32', 'b': 'str'}, {'a': 'int', 'b': 'str'}])
+    def test_encode_sample_invalid_size(self, remote_local: Tuple[str, str],
+                                        columns: Dict[str, str]) -> None:
+        local, _ = remote_local
+        writer = MDSWriter(local=local, columns=columns)
+        with pytest.raises(KeyError):
+            writer.encode_sample({'a': b'\x00\x00', 'b': 'hello'})
+
+    @pytest.mark.parametrize('columns', [{'a': 'int32'}, {'a': 'int32', 'b': 'str'}])
+    def test_encode_sample_invalid_array(self, remote_local: Tuple[str, str],
+                                         columns: Dict[str, str]) -> None:
+        local, _ = remote_local
+        writer = MDSWriter(local=local, columns=columns)
+        with pytest.raises(KeyError):
+            writer.encode_sample({'a': np.array([1, 2]), 'b': 'x'})
+
+    @pytest.mark.parametrize('num_samples', [0, 1, 100])
+    def test_encode_joint_shard(self, remote_local: Tuple[str, str], num_samples: int) -> None:
+        local, _ = remote_local
+        dataset = SequenceDataset(num_samples)
+        columns = dict(zip(dataset.column_names, dataset.column_encodings))
+        writer = MDSWriter(local=local, columns=columns, size_limit=None)
+        samples = []
+        for sample in dataset:
+            writer.write(sample)
+            samples.append(writer.encode_sample(sample))
+        data = writer.encode_joint_shard()
+
+        header_size = 4 + 4 * (num_samples + 1) + len(writer.config_data)
+        sizes = np.array([0] + list(map(len, samples)), np.uint64)
+        expected_offsets = (header_size + sizes.cumsum()).astype(np.uint32)
+        assert np.frombuffer(data[:4], np.uint32)[0] == num_samples
+        assert np.array_equal(np.frombuffer(data[4:4 + 4 * (num_samples + 1)], np.uint32),
+                              expected_offsets)
+        assert data[4 + 4 * (num_samples + 1):header_size] == writer.config_data
+        assert data[header_size:] == b''.join(samples)
+
+    def test_lazy_local(self, remote_local: Tuple[str, str]) -> None:
+        local, _ = remote_local
+        dirname = os.path.join(local, 'mds')
+        writer = MDSWriter(local=dirname, columns={'a': 'int'})
+        assert not os.path.exists(dirname)
+        writer.finish()
+        assert os.listdir(dirname) == ['index.json']
+
+        writer = MDSWriter(local=dirname, columns={'a': 'int'})
+        with pytest.raises(FileExistsError):
+            writer.write({'a': 1})
+
+    def test_row_format_msgpack(self, remote_local: Tuple[str, str]) -> None:
+        msgspec = pytest.importorskip('msgspec')
+        local, _ = remote_local
+        columns = {'a': 'int32', 'b': 'str', 'c': 'pkl', 'd': 'json', 'e': 'bytes', 'f': 'float32'}
+        writer = MDSWriter(local=local, columns=columns, row_format='msgpack')
+        sample = {'a': np.int32(7), 'b': 'hi', 'c': (1, 'x'), 'd': [1, 2], 'e': b'\x01', 'f': 0.1}
+        row = msgspec.msgpack.decode(writer.encode_sample(sample))
+        encoded_c = mds_encode('pkl', (1, 'x'))
+        encoded_d = mds_encode('json', [1, 2])
+        assert row == [7, 'hi', encoded_c, encoded_d, b'\x01', float(np.float32(0.1))]
+        config = writer.get_config()
+        assert config['version'] == 3
+        assert config['row_format'] == 'msgpack'
+
+    @pytest.mark.parametrize(('encoding', 'value', 'error'), [('uint8', 300, OverflowError),
+                                                              ('int', 2.5, AttributeError),
+                                                              ('str', 5, AttributeError),
+                                                              ('bytes', 'hi', AttributeError)])
+    def test_row_format_msgpack_invalid(self, remote_local: Tuple[str, str], encoding: str,
+                                        value: Any, error: Any) -> None:
+        pytest.importorskip('msgspec')
+        local, _ = remote_local
+        writer = MDSWriter(local=local, columns={'a': encoding}, row_format='msgpack')
+        with pytest.raises(error):
+            writer.encode_sample({'a': value})
+
+    def test_invalid_row_format(self, remote_local: Tuple[str, str]) -> None:
+        local, _ = remote_local
+        with pytest.raises(ValueError):
+            MDSWriter(local=local, columns={'a': 'int'}, row_format='flatbuffer')
+
+    @pytest.mark.parametrize('compression', [None, 'gz:6'])
+    @pytest.mark.parametrize('compression_workers', [1, 3])
+    def test_compression_workers(self, remote_local: Tuple[str, str], compression: Optional[str],
+                                 compression_workers: int) -> None:
+        remote, local = remote_local
+        for dirname, workers in [(local, 0), (remote, compression_workers)]:
+            dataset = SequenceDataset(1000)
+            columns = dict(zip(dataset.column_names, dataset.column_encodings))
+            with MDSWriter(local=dirname,
+                           columns=columns,
+                           compression=compression,
+                           hashes=['sha1', 'xxh64'],
+                           size_limit=4096,
+                           compression_workers=workers) as out:
+                for sample in dataset:
+                    out.write(sample)
+
+        assert sorted(os.listdir(local)) == sorted(os.listdir(remote))
+        for basename in os.listdir(local):
+            with open(os.path.join(local, basename), 'rb') as expected:
+                with open(os.path.join(remote, basename), 'rb') as actual:
+                    assert expected.read() == actual.read()
+
+    def test_compression_workers_uncompressed(self, remote_local: Tuple[str, str]) -> None:
+        local, _ = remote_local
+        writer = MDSWriter(local=local, columns={'a': 'int'}, compression_workers=2)
+        assert writer._pool is None
+        writer.finish()
+
+    def test_compression_workers_error(self, remote_local: Tuple[str, str],
+                                       monkeypatch: Any) -> None:
+        local, _ = remote_local
+        monkeypatch.setattr(mds_writer, 'process_shard_file', _fail_shard_file)
+        writer = MDSWriter(local=local,
+                           columns={'a': 'int'},
+                           compression='gz:6',
+                           compression_workers=1)
+        pool = writer._pool
+        assert pool is not None
+        writer.write({'a': 1})
+        with pytest.raises(RuntimeError):
+            writer.finish()
+
+        # The worker's error still shuts down the pool.
+        assert writer._pool is None
+        with pytest.raises(RuntimeError):
+            pool.submit(int)
+
+    @pytest.mark.parametrize('compression', [None, 'gz:6'])
+    @pytest.mark.parametrize('compression_workers', [0, 2])
+    @pytest.mark.parametrize('hashes', [[], ['sha1', 'xxh64']])
+    def test_shard_hashes(self, remote_local: Tuple[str, str], compression: Optional[str],
+                          compression_workers: int, hashes: List[str]) -> None:
+        local, _ = remote_local
+        dataset = SequenceDataset(1000)
+        columns = dict(zip(dataset.column_names, dataset.column_encodings))
+        with MDSWriter(local=local,
+                       columns=columns,
+                       compression=compression,
+                       hashes=hashes,
+                       size_limit=4096,
+                       compression_workers=compression_workers) as out:
+            for sample in dataset:
+                out.write(sample)
+
+        with open(os.path.join(local, 'index.json')) as fp:
+            shards = json.load(fp)['shards']
+
+        # Only the final form of each shard is left behind.
+        basenames = [(shard['zip_data'] or shard['raw_data'])['basename'] for shard in shards]
+        assert sorted(os.listdir(local)) == sorted(basenames + ['index.json'])
+
+        for shard in shards:
+            info = shard['zip_data'] if compression else shard['raw_data']
+            with open(os.path.join(local, info['basename']), 'rb') as fp:
+                data = fp.read()
+            assert info['bytes'] == len(data)
+            assert info['hashes'] == {algo: get_hash(algo, data) for algo in hashes}
+            if compression:
+                raw_data = decompress(compression, data)
+                raw_info = shard['raw_data']
+                assert raw_info['bytes'] == len(raw_data)
+                assert raw_info['hashes'] == {algo: get_hash(algo, raw_data) for algo in hashes}
+
     @pytest.mark.parametrize('num_samples', [1000, 10000])
     @pytest.mark.parametrize('size_limit', [4096, 16_777_216])
     def test_number_of_files(self, remote_local: Tuple[str, str], num_samples: int,
@@ -209,6 +459,24 @@ class TestXSVWriter:
                             size_limit=size_limit)
         assert writer.get_config() == expected_config
 
+    @pytest.mark.parametrize('num_samples', [0, 1, 100])
+    def test_encode_split_shard(self, remote_local: Tuple[str, str], num_samples: int) -> None:
+        local, _ = remote_local
+        dataset = SequenceDataset(num_samples)
+        columns = dict(zip(dataset.column_names, dataset.column_encodings))
+        writer = CSVWriter(local=local, columns=columns, size_limit=None)
+        for sample in dataset:
+            writer.write(sample)
+        data, meta = writer.encode_split_shard()
+
+        header_size = len(','.join(dataset.column_names) + '\n')
+        sizes = np.array([0] + list(map(len, writer.new_samples)), np.uint64)
+        expected_offsets = (header_size + sizes.cumsum()).astype(np.uint32)
+        assert np.frombuffer(meta[:4], np.uint32)[0] == num_samples
+        assert np.array_equal(np.frombuffer(meta[4:4 + 4 * (num_samples + 1)], np.uint32),
+                              expected_offsets)
+        assert expected_offsets[-1] == len(data)
+
     @pytest.mark.parametrize('num_samples', [50000])
     @pytest.mark.parametrize('size_limit', [65_536])
     @pytest.mark.parametrize('seed', [1234])
@@ -249,3 +517,21 @@ class TestXSVWriter:
         # Ensure sample iterator is deterministic
         for before, after in zip(dataset, mds_dataset):
             assert before == after
+
+
+@pytest.mark.parametrize('size', [100, 1 << 21])
+@pytest.mark.parametrize('hashes', [[], ['sha1'], ['sha1', 'sha256', 'xxh64']])
+def test_get_file_info(size: int, hashes: List[str]) -> None:
+    data = os.urandom(size)
+    info = get_file_info(data, 'shard.00000.mds', hashes)
+    expected_hashes = {algo: get_hash(algo, data) for algo in hashes}
+    assert info == {'basename': 'shard.00000.mds', 'bytes': size, 'hashes': expected_hashes}
+
+
+@pytest.mark.parametrize('size', [100, 1 << 21])
+@pytest.mark.parametrize('hashes', [[], ['sha1'], ['sha1', 'sha256', 'xxh64']])
+def test_hash_chunks(size: int, hashes: List[str]) -> None:
+    data = os.urandom(size)
+    chunks = [data[i:i + 4096] for i in range(0, size, 4096)]
+    digests = hash_chunks(iter(chunks), size, hashes)
+    assert digests == {algo: get_hash(algo, data) for algo in hashes}